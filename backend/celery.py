@@ -1,16 +1,60 @@
 # backend/workikai_project/celery.py
 import os
+import orjson
 from celery import Celery
+from celery.signals import celeryd_init
+from kombu import Exchange, Queue
+from kombu.serialization import register
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'workikai_project.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 from django.conf import settings  # noqa
 
+register(
+    'orjson',
+    lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+    orjson.loads,
+    content_type='application/x-orjson',
+    content_encoding='binary',
+)
+
 app = Celery('workikai_project')
 # Broker / backend configured with environment variables (fallback to local redis)
 app.conf.broker_url = os.getenv('CELERY_BROKER_URL', getattr(settings, 'CELERY_BROKER_URL', 'redis://127.0.0.1:6379/0'))
 app.conf.result_backend = os.getenv('CELERY_RESULT_BACKEND', getattr(settings, 'CELERY_RESULT_BACKEND', app.conf.broker_url))
-app.conf.task_serializer = 'json'
-app.conf.result_serializer = 'json'
-app.conf.accept_content = ['json']
+app.conf.task_serializer = 'orjson'
+app.conf.result_serializer = 'orjson'
+# keep plain json accepted so messages published before the switch still decode
+app.conf.accept_content = ['orjson', 'json']
+# Bound and reuse Redis connections rather than opening one per publish/result fetch
+app.conf.broker_pool_limit = 10
+app.conf.broker_transport_options = {'max_connections': 20, 'socket_keepalive': True}
+app.conf.redis_max_connections = 20
+app.conf.result_backend_transport_options = {'socket_keepalive': True}
+# Recycle worker processes only after many tasks so per-process warm state (tesserocr
+# models, FX/preference caches) is reused, while still bounding slow memory growth
+app.conf.worker_max_tasks_per_child = int(os.getenv('CELERY_MAX_TASKS_PER_CHILD', '1000'))
+# Network-bound tasks (FX lookups) go to their own queue, served by a green-thread worker:
+#   celery -A backend worker -Q io -P eventlet -c 20
+# Automated validation and task audit entries can be re-run/lost without harm, so they
+# go to 'transient': a non-durable queue with non-persistent messages (no broker fsync):
+#   celery -A backend worker -Q transient -c 2
+app.conf.task_queues = (
+    Queue('celery'),
+    Queue('io'),
+    Queue('transient', Exchange('transient', delivery_mode=1), routing_key='transient', durable=False),
+)
+app.conf.task_routes = {
+    'documents.tasks.compute_duties': {'queue': 'io'},
+    'documents.tasks.record_audit_log': {'queue': 'transient'},
+    'documents.tasks.run_validation_task': {'queue': 'transient'},
+}
 app.autodiscover_tasks()
+
+
+@celeryd_init.connect
+def limit_ocr_threads(**kwargs):
+    # Pages are OCR'd in parallel tesseract processes; keep each one single-threaded so
+    # they don't oversubscribe the CPUs. Set in the worker's main process, before task
+    # modules load tesserocr or the pool forks, so web processes keep their environment
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
@@ -0,0 +1,40 @@
+import logging
+
+from django.db import transaction
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+def record_audit(request, action, details=None):
+    """
+    Queue an AuditLog entry for the current request. AuditLogMiddleware writes all
+    entries queued during the request with a single bulk INSERT once the response
+    is built. Inside a transaction (e.g. an atomic view) or without the middleware
+    the entry is saved immediately, so it commits or rolls back with the action.
+    """
+    django_request = getattr(request, '_request', request)  # unwrap DRF's Request
+    entry = AuditLog(user=request.user, action=action, details=details)
+    pending = getattr(django_request, '_pending_audit', None)
+    if pending is None or transaction.get_connection().in_atomic_block:
+        entry.save()
+    else:
+        pending.append(entry)
+
+
+class AuditLogMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._pending_audit = []
+        response = self.get_response(request)
+        if request._pending_audit:
+            # the audited actions are already committed; a failed audit write must not
+            # turn their response into a 500
+            try:
+                AuditLog.objects.bulk_create(request._pending_audit)
+            except Exception:
+                logger.exception('Failed to write %d audit log entries', len(request._pending_audit))
+        return response
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-15 10:33
+
+from django.db import migrations, models
+
+
+def backfill_hs_code(apps, schema_editor):
+    TradeDocument = apps.get_model('documents', 'TradeDocument')
+    for doc in TradeDocument.objects.exclude(metadata={}).only('id', 'metadata').iterator():
+        hs_code = str((doc.metadata or {}).get('hs_code') or '').strip()
+        if hs_code:
+            TradeDocument.objects.filter(pk=doc.pk).update(hs_code=hs_code[:32])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_tradedocument_status_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tradedocument',
+            name='hs_code',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+        migrations.RunPython(backfill_hs_code, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-15 10:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_tradedocument_hs_code'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tradedocument',
+            index=models.Index(fields=['status', 'assigned_reviewer'], name='td_status_reviewer_idx'),
+        ),
+        # td_status_idx is the left prefix of td_status_reviewer_idx, which serves the
+        # status-only filters as well
+        migrations.RemoveIndex(
+            model_name='tradedocument',
+            name='td_status_idx',
+        ),
+    ]
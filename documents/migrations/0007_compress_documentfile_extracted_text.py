@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-15 10:36
+
+import zlib
+
+from django.db import migrations, models
+
+
+def compress_extracted_text(apps, schema_editor):
+    DocumentFile = apps.get_model('documents', 'DocumentFile')
+    for df in DocumentFile.objects.exclude(extracted_text__isnull=True).only('id', 'extracted_text').iterator():
+        DocumentFile.objects.filter(pk=df.pk).update(extracted_text_compressed=zlib.compress(df.extracted_text.encode('utf-8')))
+
+
+def decompress_extracted_text(apps, schema_editor):
+    DocumentFile = apps.get_model('documents', 'DocumentFile')
+    for df in DocumentFile.objects.exclude(extracted_text_compressed__isnull=True).only('id', 'extracted_text_compressed').iterator():
+        DocumentFile.objects.filter(pk=df.pk).update(extracted_text=zlib.decompress(df.extracted_text_compressed).decode('utf-8'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_tradedocument_status_reviewer_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentfile',
+            name='extracted_text_compressed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(compress_extracted_text, decompress_extracted_text),
+        migrations.RemoveField(
+            model_name='documentfile',
+            name='extracted_text',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-15 10:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_compress_documentfile_extracted_text'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tradedocument',
+            index=models.Index(fields=['-created_at', '-id'], name='td_created_id_idx'),
+        ),
+    ]
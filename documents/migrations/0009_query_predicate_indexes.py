@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-15 10:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_tradedocument_created_id_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['document', '-created_at'], name='comment_doc_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tradedocument',
+            index=models.Index(fields=['uploader', '-created_at'], name='td_uploader_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tradedocument',
+            index=models.Index(fields=['doc_type', 'status'], name='td_doctype_status_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def create_metadata_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    TradeDocument = apps.get_model('documents', 'TradeDocument')
+    table = schema_editor.quote_name(TradeDocument._meta.db_table)
+    schema_editor.execute(f'CREATE INDEX IF NOT EXISTS td_metadata_gin ON {table} USING gin (metadata)')
+
+
+def drop_metadata_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS td_metadata_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_query_predicate_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_metadata_gin_index, drop_metadata_gin_index),
+    ]
@@ -1,3 +1,4 @@
+import zlib
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
@@ -36,10 +37,33 @@ class TradeDocument(models.Model):
     last_validation = models.JSONField(null=True, blank=True)
     # metadata holds any textual numeric metadata (e.g. value, currency) submitted along with files
     metadata = models.JSONField(default=dict, blank=True)
+    # denormalized from metadata['hs_code'] so matching documents can be looked up by index
+    hs_code = models.CharField(max_length=32, db_index=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'assigned_reviewer'], name='td_status_reviewer_idx'),
+            models.Index(fields=['-created_at', '-id'], name='td_created_id_idx'),
+            models.Index(fields=['uploader', '-created_at'], name='td_uploader_created_idx'),
+            models.Index(fields=['doc_type', 'status'], name='td_doctype_status_idx'),
+        ]
+        # On Postgres, metadata also has a GIN index (td_metadata_gin) backing the
+        # metadata__has_keys/contains lookups used by validation. It is created in
+        # migration 0010 only on that backend, so it is not declared here.
 
     def __str__(self):
         return f"{self.get_doc_type_display()} ({self.id}) by {self.uploader.username}"
 
+# Fields required as file uploads per doc type (ordered: files are stored and reported in this order)
+REQUIRED_FIELDS = {
+    TradeDocument.TYPE_INVOICE: ('hs_code','goods_description','unit_of_measure','quantity','weight','value','currency'),
+    TradeDocument.TYPE_PACKING: ('hs_code','goods_description','unit_of_measure','quantity','gross_weight','net_weight','number_of_packages'),
+    TradeDocument.TYPE_BOL: ('shipper','consignee','hs_code','weight','number_of_packages','bol_awb_number'),
+    TradeDocument.TYPE_DELIVERY: ('consignee','container_number','port_of_discharge','currency','value','hs_code'),
+}
+# Same fields as frozensets, so presence checks are a single set difference
+REQUIRED_FIELD_SETS = {doc_type: frozenset(fields) for doc_type, fields in REQUIRED_FIELDS.items()}
+
 class DocumentFile(models.Model):
     """
     Represents a file uploaded for a specific required subfield of a TradeDocument.
@@ -78,6 +102,11 @@ class Comment(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['document', '-created_at'], name='comment_doc_created_idx'),
+        ]
+
 class CurrencyRate(models.Model):
     currency = models.CharField(max_length=10, unique=True)
     rate_to_aed = models.DecimalField(max_digits=20, decimal_places=6)
@@ -112,7 +141,8 @@ class DocumentFile(models.Model):
     """
     Represents a file uploaded for a specific sub-field of a TradeDocument.
     extraction_status: pending/running/done/failed
-    extracted_text: full text extracted by OCR/text-extraction
+    extracted_text: full text extracted by OCR/text-extraction, stored zlib-compressed
+    in extracted_text_compressed so large OCR dumps stay small on disk and over the wire
     """
     STATUS_PENDING = 'pending'
     STATUS_RUNNING = 'running'
@@ -131,7 +161,7 @@ class DocumentFile(models.Model):
     uploaded_at = models.DateTimeField(default=timezone.now)
 
     extraction_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
-    extracted_text = models.TextField(null=True, blank=True)
+    extracted_text_compressed = models.BinaryField(null=True, blank=True)
 
     class Meta:
         unique_together = ('document', 'field_name')
@@ -139,8 +169,21 @@ class DocumentFile(models.Model):
     def __str__(self):
         return f"File for {self.field_name} of doc {self.document_id}"
 
+    @property
+    def extracted_text(self):
+        if self.extracted_text_compressed is None:
+            return None
+        return zlib.decompress(self.extracted_text_compressed).decode('utf-8')
+
+    @extracted_text.setter
+    def extracted_text(self, text):
+        self.extracted_text_compressed = None if text is None else zlib.compress(text.encode('utf-8'))
+
     def get_text_snippet(self, length=400):
-        if not self.extracted_text:
+        if not self.extracted_text_compressed:
             return ''
-        txt = self.extracted_text.strip().replace('\n', ' ')
-        return txt[:length] + ('...' if len(txt) > length else '')
+        # only inflate enough bytes for the snippet (utf-8 is at most 4 bytes per char)
+        decompressor = zlib.decompressobj()
+        head = decompressor.decompress(self.extracted_text_compressed, (length + 1) * 4)
+        txt = head.decode('utf-8', 'ignore').strip().replace('\n', ' ')
+        return txt[:length] + ('...' if len(txt) > length or not decompressor.eof else '')
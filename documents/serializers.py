@@ -1,22 +1,42 @@
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
 from .models import TradeDocument, DocumentFile, ValidationRule, ValidationResult, Comment, CurrencyRate, AuditLog, UserPreference
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+def build_file_url(serializer, obj):
+    """
+    Absolute URL for a DocumentFile. For local storage the host + MEDIA_URL prefix is
+    computed once per serializer (i.e. once per list) instead of resolving it per row.
+    """
+    if not obj.file:
+        return None
+    request = serializer.context.get('request')
+    storage = obj.file.storage
+    if not isinstance(storage, FileSystemStorage):
+        return request.build_absolute_uri(obj.file.url) if request else obj.file.url
+    prefix = getattr(serializer, '_media_url_prefix', None)
+    if prefix is None:
+        prefix = storage.base_url
+        if request and prefix.startswith('/'):
+            prefix = request.build_absolute_uri('/')[:-1] + prefix
+        serializer._media_url_prefix = prefix
+    return prefix + filepath_to_uri(obj.file.name).lstrip('/')
+
 class DocumentFileSerializer(serializers.ModelSerializer):
+    # same URL as file_url; DRF's FileField would resolve storage + host per row
+    file = serializers.SerializerMethodField(method_name='get_file_url')
     file_url = serializers.SerializerMethodField()
 
     class Meta:
         model = DocumentFile
         fields = ('id', 'field_name', 'file', 'file_url', 'uploaded_at')
-        read_only_fields = ('id','file_url','uploaded_at')
+        read_only_fields = ('id','file','file_url','uploaded_at')
 
     def get_file_url(self, obj):
-        request = self.context.get('request')
-        if obj.file:
-            return request.build_absolute_uri(obj.file.url) if request else obj.file.url
-        return None
+        return build_file_url(self, obj)
 
 class TradeDocumentListSerializer(serializers.ModelSerializer):
     uploader = serializers.StringRelatedField()
@@ -38,16 +58,43 @@ class TradeDocumentDetailSerializer(serializers.ModelSerializer):
         fields = ('id','doc_type','uploader','status','created_at','updated_at','assigned_reviewer','files','comments','last_validation','metadata')
 
     def get_comments(self, obj):
-        return [{'user': c.user.username, 'text': c.text, 'created_at': c.created_at} for c in obj.comments.all().order_by('-created_at')]
+        # one JOINed query returning tuples; no Comment/User instances are built
+        rows = obj.comments.order_by('-created_at').values_list('user__username', 'text', 'created_at')
+        return [{'user': username, 'text': text, 'created_at': created_at} for username, text, created_at in rows]
 
 class UploadDocumentSerializer(serializers.Serializer):
     """
     The upload endpoint will accept multiple file parts where each part name equals a required field name.
     Additionally, a 'metadata' JSON string can be sent for numeric/text metadata (e.g. value/currency).
+    currency/value/hs_code may also be sent as plain form fields; validation folds them into
+    metadata once so the view and background tasks only ever read validated_data['metadata'].
     """
     doc_type = serializers.ChoiceField(choices=TradeDocument.DOC_TYPE_CHOICES)
     # files are read directly from request.FILES in view
     metadata = serializers.JSONField(required=False)
+    currency = serializers.CharField(required=False, allow_blank=True, write_only=True)
+    value = serializers.CharField(required=False, allow_blank=True, write_only=True)
+    hs_code = serializers.CharField(required=False, allow_blank=True, write_only=True)
+
+    def validate_metadata(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('metadata must be a JSON object.')
+        return value
+
+    def validate(self, attrs):
+        metadata = dict(attrs.get('metadata') or {})
+        # currency/value only feed the delivery order duties calculation
+        fallback_keys = ('currency', 'value', 'hs_code') if attrs['doc_type'] == TradeDocument.TYPE_DELIVERY else ('hs_code',)
+        for key in fallback_keys:
+            if not metadata.get(key) and attrs.get(key):
+                metadata[key] = attrs[key]
+        hs_code = str(metadata.get('hs_code') or '').strip() or None
+        max_length = TradeDocument._meta.get_field('hs_code').max_length
+        if hs_code and len(hs_code) > max_length:
+            raise serializers.ValidationError({'hs_code': f'Ensure this field has no more than {max_length} characters.'})
+        attrs['metadata'] = metadata
+        attrs['hs_code'] = hs_code
+        return attrs
 
 class CommentSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
@@ -81,21 +128,27 @@ class UserPreferenceSerializer(serializers.ModelSerializer):
         model = UserPreference
         fields = ('dark_mode','email_notifications')
 
+    def update(self, instance, validated_data):
+        # only write the columns that were submitted
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
 
 class DocumentFileSerializer(serializers.ModelSerializer):
+    # same URL as file_url; DRF's FileField would resolve storage + host per row
+    file = serializers.SerializerMethodField(method_name='get_file_url')
     file_url = serializers.SerializerMethodField()
     extracted_text_snippet = serializers.SerializerMethodField()
 
     class Meta:
         model = DocumentFile
         fields = ('id', 'field_name', 'file', 'file_url', 'uploaded_at', 'extraction_status', 'extracted_text', 'extracted_text_snippet')
-        read_only_fields = ('id', 'file_url', 'uploaded_at', 'extraction_status', 'extracted_text', 'extracted_text_snippet')
+        read_only_fields = ('id', 'file', 'file_url', 'uploaded_at', 'extraction_status', 'extracted_text', 'extracted_text_snippet')
 
     def get_file_url(self, obj):
-        request = self.context.get('request')
-        if obj.file:
-            return request.build_absolute_uri(obj.file.url) if request else obj.file.url
-        return None
+        return build_file_url(self, obj)
 
     def get_extracted_text_snippet(self, obj):
         return obj.get_text_snippet()
@@ -113,4 +166,6 @@ class TradeDocumentDetailSerializer(serializers.ModelSerializer):
         fields = ('id','doc_type','uploader','status','created_at','updated_at','assigned_reviewer','files','comments','last_validation','metadata')
 
     def get_comments(self, obj):
-        return [{'user': c.user.username, 'text': c.text, 'created_at': c.created_at} for c in obj.comments.all().order_by('-created_at')]
+        # one JOINed query returning tuples; no Comment/User instances are built
+        rows = obj.comments.order_by('-created_at').values_list('user__username', 'text', 'created_at')
+        return [{'user': username, 'text': text, 'created_at': created_at} for username, text, created_at in rows]
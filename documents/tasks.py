@@ -0,0 +1,571 @@
+# backend/documents/tasks.py
+import hashlib
+import io
+import subprocess
+import tempfile
+import math
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from celery import current_task, shared_task
+from celery.signals import worker_process_init
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import DocumentFile, TradeDocument, ValidationResult, AuditLog, REQUIRED_FIELDS, REQUIRED_FIELD_SETS
+from .utils import get_rate_to_aed, calculate_duties_from_hs
+import fitz  # pymupdf
+import pytesseract
+from PIL import Image
+import re
+import os
+
+# Extracted text kept per DocumentFile; extraction stops reading pages past this
+EXTRACTED_TEXT_MAX_CHARS = 100000
+
+# Pages with less embedded text than this are treated as scanned and OCR'd, unless the
+# document already has OCR_SKIP_MIN_CHARS of embedded text and at most a quarter of its
+# pages look scanned
+MIN_PAGE_TEXT_CHARS = 30
+OCR_SKIP_MIN_CHARS = 500
+OCR_SKIP_MAX_SCANNED_RATIO = 0.25
+
+# Scanned pages are rendered at OCR_DPI (plenty for body text); oversized pages are
+# rendered at a lower DPI so no bitmap exceeds OCR_MAX_PIXELS
+OCR_DPI = 150
+OCR_MAX_PIXELS = 12_000_000
+# Pages handed to each tesseract process, so its language model loads once per batch
+OCR_PAGES_PER_PROCESS = 4
+
+try:
+    # optional: with tesserocr the language model stays loaded in the worker process
+    from tesserocr import PyTessBaseAPI
+except ImportError:
+    PyTessBaseAPI = None
+
+# Idle PyTessBaseAPI instances owned by this worker process, at most
+# TESSEROCR_MAX_IDLE_APIS of them (each holds a loaded language model)
+TESSEROCR_MAX_IDLE_APIS = 1
+_tess_apis = []
+_tess_apis_lock = threading.Lock()
+
+# Patterns used by parse_text_for_metadata, compiled once at import
+_WS_RE = re.compile(r'\s+')
+PARSE_HEAD_CHARS = 20000
+PARSE_CUT_OVERLAP = 64
+PARSE_CACHE_TIMEOUT = 3600
+# Part of the parse cache key; bump it whenever parse_text_for_metadata's output changes
+# so results cached by the previous parser are not served
+PARSE_CACHE_VERSION = 2
+# HS code, AWB/BOL number and value fused into one alternation so the text is scanned
+# once; the named group that matched (m.lastgroup) is the metadata key. Alternatives are
+# tried in this order at each position, so an AWB digit run wins over a plain amount.
+# Currency and container codes are searched separately: an AWB match may contain them
+# (e.g. 'AWB USD') and they must still be found.
+_FIELDS_RE = re.compile(
+    r'(?i:\bHS[:\s]*(?P<hs_code>[0-9]{4,10})\b)'
+    r'|\b(?P<bol_awb_number>(?i:AWB[-:\s]{0,3}[\w-]{3,20}|\d{3}\s?\d{8}))\b'
+    r'|(?P<value>[\d.,]{3,})\b'
+)
+_FUSED_KEYS = frozenset(_FIELDS_RE.groupindex)
+_CODE_RES = (
+    ('currency', re.compile(r'\b(AED|USD|EUR|GBP|JPY|CHF|SAR|INR)\b')),
+    ('container_number', re.compile(r'\b([A-Z]{4}\d{7})\b')),
+)
+_FIELD_KEYS = _FUSED_KEYS.union(key for key, _ in _CODE_RES)
+_HS_FALLBACK_RE = re.compile(r'\b([0-9]{6})\b')
+_VAL_CLEAN_RE = re.compile(r'[^\d\.]')
+# Strict forms stop a name at a run of spaces (or the end of the text); the capture is
+# bounded, can't cross a newline and must start on a word character (so a bare trailing
+# 'Consignee:' doesn't capture its own colon)
+_CONSIGNEE_STRICT_RE = re.compile(r'Consignee[:\s]*(\w[^\n]{0,79}?)(?:\s{2,}|$)', re.IGNORECASE)
+_CONSIGNEE_LOOSE_RE = re.compile(r'Consignee[:\s]*(\w[\w\s\,\-\.]{1,80})', re.IGNORECASE)
+_SHIPPER_STRICT_RE = re.compile(r'Shipper[:\s]*(\w[^\n]{0,79}?)(?:\s{2,}|$)', re.IGNORECASE)
+_SHIPPER_LOOSE_RE = re.compile(r'Shipper[:\s]*(\w[\w\s\,\-\.]{1,80})', re.IGNORECASE)
+
+def _scan_fields(s_norm, res):
+    """
+    One pass for HS code ("HS" prefix), AWB/BOL number and value (first amount-like
+    number), stopping as soon as all three are filled, then a search each for the
+    currency code and container number (e.g. ABCD1234567). The first hit per key wins.
+    """
+    for m in _FIELDS_RE.finditer(s_norm):
+        key = m.lastgroup
+        if key in res:
+            continue
+        if key == 'value':
+            v_clean = _VAL_CLEAN_RE.sub('', m.group(key))
+            if v_clean:
+                res[key] = v_clean
+        else:
+            res[key] = m.group(key).strip()
+        if _FUSED_KEYS.issubset(res):
+            break
+    for key, pattern in _CODE_RES:
+        if key not in res:
+            m = pattern.search(s_norm)
+            if m:
+                res[key] = m.group(1)
+
+
+def parse_text_for_metadata(text):
+    """
+    Heuristic parse of a text blob to extract keys:
+    hs_code, value, currency, container_number, consignee, shipper, bol_awb_number
+    """
+    if not text:
+        return {}
+    res = {}
+    s = text
+
+    # Header fields almost always sit near the top, so scan the first ~20KB (cut at a
+    # whitespace boundary) and only normalise/scan the rest if something is missing
+    cut = _WS_RE.search(s, PARSE_HEAD_CHARS) if len(s) > PARSE_HEAD_CHARS else None
+    s_norm = _WS_RE.sub(' ', s[:cut.start()] if cut else s)
+    segments = [s_norm]
+    _scan_fields(s_norm, res)
+    if cut and not _FIELD_KEYS.issubset(res):
+        # resume at the cut instead of rescanning the head; starting from a word boundary
+        # a little before it still catches a field split across the cut (e.g. 'HS 8504')
+        overlap = max(s_norm.rfind(' ', 0, len(s_norm) - PARSE_CUT_OVERLAP), 0)
+        tail = s_norm[overlap:] + _WS_RE.sub(' ', s[cut.start():])
+        segments.append(tail)
+        _scan_fields(tail, res)
+
+    # HS code fallback: first standalone 6-digit number
+    if 'hs_code' not in res:
+        for segment in segments:
+            fallback = _HS_FALLBACK_RE.search(segment)
+            if fallback:
+                res['hs_code'] = fallback.group(1)
+                break
+
+    # Consignee/shipper heuristics; a plain substring check on the label skips both
+    # case-insensitive regex scans on documents that don't carry it
+    lowered = s.lower()
+    if 'consignee' in lowered:
+        consignee = _CONSIGNEE_STRICT_RE.search(s)
+        if consignee:
+            res['consignee'] = consignee.group(1).strip()
+        else:
+            m = _CONSIGNEE_LOOSE_RE.search(s)
+            if m:
+                res['consignee'] = m.group(1).strip()
+
+    if 'shipper' in lowered:
+        shipper = _SHIPPER_STRICT_RE.search(s)
+        if shipper:
+            res['shipper'] = shipper.group(1).strip()
+        else:
+            m2 = _SHIPPER_LOOSE_RE.search(s)
+            if m2:
+                res['shipper'] = m2.group(1).strip()
+
+    return res
+
+def parse_text_cached(text):
+    """
+    parse_text_for_metadata memoized in the shared cache by a digest of the text, so
+    re-uploaded documents and task retries skip the regex passes. The cache is best
+    effort: if it is unreachable the text is simply parsed.
+    """
+    if not text:
+        return {}
+    digest = hashlib.blake2b(text.encode('utf-8', 'ignore'), digest_size=16).hexdigest()
+    key = f'parse:v{PARSE_CACHE_VERSION}:{digest}'
+    try:
+        parsed = cache.get(key)
+    except Exception:
+        parsed = None
+    if parsed is None:
+        parsed = parse_text_for_metadata(text)
+        try:
+            cache.set(key, parsed, PARSE_CACHE_TIMEOUT)
+        except Exception:
+            pass
+    return parsed
+
+def ocr_worker_count():
+    """
+    Tesseract processes one document may run at once: OCR_MAX_WORKERS when set, else
+    the CPUs shared out across the Celery worker's concurrent tasks (so a prefork
+    worker at its default concurrency runs one per task), or every CPU outside a worker.
+    """
+    configured = getattr(settings, 'OCR_MAX_WORKERS', 0)
+    if configured:
+        return max(1, configured)
+    cpus = os.cpu_count() or 1
+    task = current_task
+    if task and not task.request.is_eager:
+        concurrency = task.app.conf.worker_concurrency or cpus
+        return max(1, cpus // concurrency)
+    return cpus
+
+def extract_document_text(path, dpi=OCR_DPI, max_chars=EXTRACTED_TEXT_MAX_CHARS):
+    """
+    Extract text page by page with PyMuPDF, OCR'ing only the pages whose embedded
+    text is (nearly) empty, e.g. scanned pages of a mixed PDF. Those pages are
+    rasterized with PyMuPDF and OCR'd in batches (ocr_worker_count() processes of
+    OCR_PAGES_PER_PROCESS pages) so only a batch of page images is held in memory.
+    A document that is mostly embedded text (see OCR_SKIP_MIN_CHARS) isn't OCR'd at all.
+    Text is streamed into a buffer capped at max_chars; pages past the cap are never
+    read or OCR'd.
+    """
+    try:
+        doc = fitz.open(path)
+    except Exception:
+        # not something PyMuPDF can open; OCR it as a plain image
+        return ocr_pdf_images(path, dpi=dpi)
+
+    batch_size = ocr_worker_count() * OCR_PAGES_PER_PROCESS
+    buf = io.StringIO()
+    remaining = max_chars
+    written = 0
+
+    def write_pages(end):
+        # stream texts[written:end] into the buffer until the budget is spent
+        nonlocal remaining, written
+        for txt in texts[written:end]:
+            if not txt or remaining <= 0:
+                continue
+            txt = txt[:remaining]
+            buf.write(txt)
+            buf.write('\n')
+            remaining -= len(txt) + 1
+        written = end
+
+    with doc:
+        # embedded text is cheap; read it (up to the budget) before deciding what to OCR
+        texts = []
+        embedded_chars = 0
+        for page in doc:
+            txt = page.get_text()
+            texts.append(txt)
+            embedded_chars += len(txt)
+            if embedded_chars >= max_chars:
+                break
+        scanned = [i for i, txt in enumerate(texts) if len(txt.strip()) < MIN_PAGE_TEXT_CHARS]
+        if embedded_chars >= OCR_SKIP_MIN_CHARS and len(scanned) <= len(texts) * OCR_SKIP_MAX_SCANNED_RATIO:
+            # a text PDF with a few blank/cover pages; OCR would cost far more than it adds
+            scanned = []
+
+        for start in range(0, len(scanned), batch_size):
+            batch = scanned[start:start + batch_size]
+            write_pages(batch[0])
+            if remaining <= 0:
+                break
+            try:
+                images = [render_page_image(doc[i], dpi) for i in batch]
+                ocr_texts = ocr_images(images)
+            except Exception:
+                # OCR is best effort: keep whatever embedded text these pages have
+                continue
+            for i, ocr_text in zip(batch, ocr_texts):
+                if ocr_text and len(ocr_text.strip()) > len(texts[i].strip()):
+                    texts[i] = ocr_text
+        write_pages(len(texts))
+    return buf.getvalue().strip()
+
+def render_page_image(page, dpi=OCR_DPI):
+    """Rasterize a PyMuPDF page to an in-memory RGB image, capped at OCR_MAX_PIXELS."""
+    width_in, height_in = page.rect.width / 72, page.rect.height / 72
+    pixels = width_in * dpi * height_in * dpi
+    if pixels > OCR_MAX_PIXELS:
+        dpi = max(1, int(dpi * math.sqrt(OCR_MAX_PIXELS / pixels)))
+    pix = page.get_pixmap(dpi=dpi)
+    return Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+
+def _tesseract_batch(images):
+    """
+    OCR several images with a single tesseract process: the images are listed in a
+    file so the language model is loaded once rather than once per page. Tesseract
+    ends each page's text with a form feed, which is what the output is split on.
+    """
+    if len(images) == 1:
+        return [pytesseract.image_to_string(images[0])]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = []
+        for n, im in enumerate(images):
+            img_path = os.path.join(tmpdir, f'{n}.tif')
+            im.save(img_path, format='TIFF')
+            paths.append(img_path)
+        list_path = os.path.join(tmpdir, 'pages.txt')
+        with open(list_path, 'w') as fh:
+            fh.write('\n'.join(paths) + '\n')
+        proc = subprocess.run([pytesseract.pytesseract.tesseract_cmd, list_path, 'stdout'], capture_output=True, check=True)
+    texts = proc.stdout.decode('utf-8', errors='replace').split('\f')
+    if len(texts) < len(images):
+        # a page was skipped, so texts can't be matched to pages; OCR them one by one
+        return [pytesseract.image_to_string(im) for im in images]
+    return texts[:len(images)]
+
+@worker_process_init.connect
+def _reset_tess_apis(**kwargs):
+    # a forked child must build its own instances rather than reuse the parent's
+    _tess_apis.clear()
+
+def _tesserocr_batch(images):
+    """
+    OCR images with a warm in-process tesseract (tesserocr). Instances are created on
+    first use and up to TESSEROCR_MAX_IDLE_APIS are kept for the life of the worker
+    process; an instance created for an extra concurrent batch is ended afterwards.
+    """
+    with _tess_apis_lock:
+        api = _tess_apis.pop() if _tess_apis else None
+    if api is None:
+        api = PyTessBaseAPI()
+    try:
+        texts = []
+        for im in images:
+            api.SetImage(im)
+            texts.append(api.GetUTF8Text())
+        return texts
+    finally:
+        with _tess_apis_lock:
+            keep = len(_tess_apis) < TESSEROCR_MAX_IDLE_APIS
+            if keep:
+                _tess_apis.append(api)
+        if not keep:
+            api.End()
+
+def ocr_images(images):
+    """
+    OCR a list of images, returning their text in order. The images are split into
+    up to ocr_worker_count() contiguous batches, each OCR'd by one tesseract process
+    (or a warm tesserocr instance when installed); a thread pool runs the batches in
+    parallel (threads rather than processes because Celery's prefork children are
+    daemonic and can't fork a pool).
+    """
+    if not images:
+        return []
+    ocr_batch = _tesserocr_batch if PyTessBaseAPI is not None else _tesseract_batch
+    workers = min(ocr_worker_count(), len(images))
+    size = -(-len(images) // max(1, workers))
+    batches = [images[i:i + size] for i in range(0, len(images), size)]
+    if len(batches) == 1:
+        return ocr_batch(batches[0])
+    with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+        return [text for texts in pool.map(ocr_batch, batches) for text in texts]
+
+def ocr_pdf_images(path, dpi=OCR_DPI):
+    """Render every page with PyMuPDF and OCR it; files PyMuPDF can't open are OCR'd as a plain image."""
+    try:
+        with fitz.open(path) as doc:
+            images = [render_page_image(page, dpi) for page in doc]
+        text_parts = ocr_images(images)
+    except Exception:
+        try:
+            text_parts = [pytesseract.image_to_string(Image.open(path))]
+        except Exception:
+            return ""
+    return "\n".join([t for t in text_parts if t]).strip()
+
+@shared_task(ignore_result=True)
+def record_audit_log(action, details=None, user_id=None):
+    """
+    Celery task: write an AuditLog entry on behalf of another task. Routed to the
+    'transient' queue so audit writes never hold up extraction/validation.
+    """
+    AuditLog.objects.create(user_id=user_id, action=action, details=details or {})
+
+def _queue_audit_log(action, details, user_id=None):
+    """Queue an audit entry; audit logging is best effort and must never fail the caller."""
+    try:
+        record_audit_log.delay(action, details, user_id=user_id)
+    except Exception:
+        pass
+
+def _merge_document_metadata(document_id, values, fill_only=False):
+    """
+    Merge values into a document's metadata, re-reading it under a row lock so tasks
+    writing other keys concurrently (duties, sibling files' parsed fields) aren't
+    overwritten with a stale copy. With fill_only, keys that already hold a value are
+    kept. Returns the keys that were written.
+    """
+    with transaction.atomic():
+        row = TradeDocument.objects.select_for_update().filter(pk=document_id).values('metadata').first()
+        if row is None:
+            return {}
+        meta = row['metadata'] or {}
+        if fill_only:
+            values = {k: v for k, v in values.items() if k not in meta or (not meta.get(k) and v)}
+        if values:
+            meta.update(values)
+            # the indexed column is bounded; parsed text can be longer, so truncate like the 0005 backfill
+            hs_code = str(meta.get('hs_code') or '').strip()[:TradeDocument._meta.get_field('hs_code').max_length]
+            TradeDocument.objects.filter(pk=document_id).update(metadata=meta, hs_code=hs_code or None)
+    return values
+
+@shared_task
+def compute_duties(document_id):
+    """
+    Celery task: convert a delivery order's declared value to AED and compute duties
+    from its HS code, storing the results in the document metadata for the UI.
+    Routed to the 'io' queue since the FX lookup may block on an HTTP call.
+    """
+    try:
+        doc = TradeDocument.objects.only('id', 'uploader', 'metadata').get(pk=document_id)
+    except TradeDocument.DoesNotExist:
+        return {'error': 'TradeDocument not found', 'id': document_id}
+
+    meta = doc.metadata or {}
+    currency = meta.get('currency')
+    value = meta.get('value')
+    if not (currency and value):
+        return {'status': 'skipped', 'document_id': document_id}
+
+    try:
+        rate = get_rate_to_aed(currency)
+        value_in_aed = (Decimal(str(value)) * Decimal(str(rate))).quantize(Decimal('0.01'))
+        duties_res = calculate_duties_from_hs(meta.get('hs_code', ''), value_in_aed)
+    except Exception as exc:
+        _queue_audit_log('currency_conversion_failed', {'doc_id': doc.id, 'error': str(exc)}, user_id=doc.uploader_id)
+        return {'status': 'failed', 'error': str(exc)}
+
+    _merge_document_metadata(doc.pk, {'value_in_aed': str(value_in_aed), 'duties': str(duties_res['duties']), 'duty_percentage': str(duties_res['duty_percentage'])})
+    return {'status': 'done', 'document_id': document_id}
+
+@shared_task(bind=True)
+def extract_text_and_parse_task(self, document_file_id):
+    """
+    Celery task: extract text for a DocumentFile, parse metadata heuristically,
+    merge metadata into parent TradeDocument (without overwriting existing keys),
+    and queue automated validation for the parent document.
+    """
+    try:
+        # only what the task reads; the previous extracted text is about to be overwritten
+        df = DocumentFile.objects.only('id', 'file', 'extraction_status', 'document').get(pk=document_file_id)
+    except DocumentFile.DoesNotExist:
+        return {'error': 'DocumentFile not found', 'id': document_file_id}
+
+    df.extraction_status = DocumentFile.STATUS_RUNNING
+    df.save(update_fields=['extraction_status'])
+
+    file_path = df.file.path
+    extracted = ""
+
+    try:
+        extracted = extract_document_text(file_path)
+
+        df.extracted_text = extracted[:EXTRACTED_TEXT_MAX_CHARS] if extracted else ''
+        df.extraction_status = DocumentFile.STATUS_DONE
+        df.save(update_fields=['extracted_text_compressed', 'extraction_status'])
+
+        parsed = parse_text_cached(extracted)
+        if parsed and _merge_document_metadata(df.document_id, parsed, fill_only=True):
+            _queue_audit_log('metadata_auto_extracted', {'doc_id': df.document_id, 'parsed': parsed})
+
+        # validation runs as its own task so extraction doesn't wait on the cross-document queries
+        run_validation_task.delay(df.document_id)
+        return {'status': 'done', 'document_file_id': document_file_id, 'parsed': parsed}
+    except Exception as exc:
+        df.extraction_status = DocumentFile.STATUS_FAILED
+        df.save(update_fields=['extraction_status'])
+        _queue_audit_log('extraction_failed', {'document_file_id': document_file_id, 'error': str(exc), 'trace': traceback.format_exc()})
+        return {'status': 'failed', 'error': str(exc)}
+
+def _store_validation(doc, results):
+    """
+    Persist a ValidationResult and the document's last_validation in one transaction,
+    then queue the audit entry so it stays off the task's critical path.
+    """
+    with transaction.atomic():
+        ValidationResult.objects.create(document=doc, result=results, run_by=None)
+        TradeDocument.objects.filter(pk=doc.pk).update(last_validation=results)
+    _queue_audit_log('run_validation_auto', {'doc_id': doc.id, 'results': results})
+
+@shared_task(ignore_result=True)
+def run_validation_task(document_id):
+    """Celery task: automated validation after extraction, routed to the 'transient' queue."""
+    run_validation_for_document(document_id)
+
+def run_validation_for_document(document_id):
+    """
+    Run cross-document metadata-based validation for the specified document and
+    persist a ValidationResult and update TradeDocument.last_validation.
+    """
+    try:
+        doc = TradeDocument.objects.only('id', 'doc_type', 'uploader', 'metadata').get(pk=document_id)
+    except TradeDocument.DoesNotExist:
+        return None
+
+    possible_keys = ['hs_code', 'consignee', 'container_number', 'value', 'currency', 'bol_awb_number', 'shipper']
+    doc_meta = doc.metadata or {}
+    results = {}
+
+    # Determine required fields/colors for this doc_type (use mapping or existing logic)
+    missing = REQUIRED_FIELD_SETS.get(doc.doc_type, frozenset()).difference(doc.files.values_list('field_name', flat=True))
+    missing_files = [f for f in REQUIRED_FIELDS[doc.doc_type] if f in missing] if missing else []
+    results['missing_files'] = missing_files
+
+    if not doc_meta:
+        results['ready_for_approval'] = False
+        results['reason'] = 'metadata_missing'
+        results['message'] = 'Document has no metadata.'
+        _store_validation(doc, results)
+        return results
+
+    match_keys = {}
+    for k in possible_keys:
+        if k in doc_meta:
+            v = str(doc_meta[k]).strip()
+            if v:
+                match_keys[k] = v
+    results['match_keys'] = match_keys
+
+    required_types = ['invoice', 'packing_list', 'bol_awb', 'delivery_order']
+    other_types = [dtype for dtype in required_types if dtype != doc.doc_type]
+
+    # One query for every candidate of the other types; a match must carry all match keys,
+    # so filtering on key presence lets the database drop the rest (index-assisted on
+    # Postgres) while values are still compared after str().strip() below
+    candidates = TradeDocument.objects.filter(uploader_id=doc.uploader_id, doc_type__in=other_types).exclude(pk=doc.pk)
+    if match_keys:
+        candidates = candidates.filter(metadata__has_keys=list(match_keys))
+    matched = {}
+    match_items = tuple(match_keys.items())
+    # plain dicts streamed in chunks: only id/doc_type/metadata are read, so skip model instantiation
+    for cand in candidates.order_by('pk').values('id', 'doc_type', 'metadata').iterator(chunk_size=500):
+        if cand['doc_type'] in matched:
+            continue
+        cand_meta = cand['metadata'] or {}
+        # each candidate value is normalised at most once, and not at all past the first mismatch
+        if all(str(cand_meta.get(k, '')).strip() == v for k, v in match_items):
+            matched[cand['doc_type']] = cand['id']
+            if len(matched) == len(other_types):
+                break
+
+    found = {}
+    missing_types = []
+    for dtype in required_types:
+        if doc.doc_type == dtype:
+            found[dtype] = {'doc_id': doc.id, 'matched': True}
+        elif dtype in matched:
+            found[dtype] = {'doc_id': matched[dtype], 'matched': True}
+        else:
+            found[dtype] = {'matched': False}
+            missing_types.append(dtype)
+
+    results['found_types'] = {k: v for k, v in found.items() if v.get('matched')}
+    results['missing_types'] = missing_types
+
+    ready = (len(missing_files) == 0) and (len(missing_types) == 0)
+    results['ready_for_approval'] = ready
+
+    if ready:
+        results['message'] = 'All related documents found and consistent. Ready for approval.'
+    else:
+        msgs = []
+        if missing_files:
+            msgs.append(f"Missing files for this document: {missing_files}")
+        if missing_types:
+            msgs.append("Missing or unmatched document types: " + ", ".join(missing_types))
+        results['message'] = " | ".join(msgs)
+
+    _store_validation(doc, results)
+
+    return results
+
+
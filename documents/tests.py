@@ -1,3 +1,280 @@
-from django.test import TestCase
+import re
+import zlib
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .middleware import AuditLogMiddleware, record_audit
+from .models import AuditLog, DocumentFile, TradeDocument
+from .serializers import UploadDocumentSerializer
+from .tasks import parse_text_for_metadata, run_validation_for_document
+
+
+def reference_parse(text):
+    """The original one-regex-per-field parser that parse_text_for_metadata replaced."""
+    if not text:
+        return {}
+    res = {}
+    s_norm = re.sub(r'\s+', ' ', text)
+    hs = re.findall(r'\bHS[:\s]*([0-9]{4,10})\b', s_norm, re.IGNORECASE) or re.findall(r'\b([0-9]{6})\b', s_norm)
+    if hs:
+        res['hs_code'] = hs[0]
+    cur = re.search(r'\b(AED|USD|EUR|GBP|JPY|CHF|SAR|INR)\b', s_norm)
+    if cur:
+        res['currency'] = cur.group(1)
+    val = re.search(r'([£€$]?\s?[\d\.,]{3,}\b)', s_norm)
+    if val and re.sub(r'[^\d\.]', '', val.group(1)):
+        res['value'] = re.sub(r'[^\d\.]', '', val.group(1))
+    cont = re.search(r'\b([A-Z]{4}\d{7})\b', s_norm)
+    if cont:
+        res['container_number'] = cont.group(1)
+    awb = re.search(r'\b(AWB[:\s-]*\w+|\d{3}\s?\d{8}|\bAWB[\w-]{3,}\b)\b', s_norm, re.IGNORECASE)
+    if awb:
+        res['bol_awb_number'] = awb.group(0).strip()
+    for key, label in (('consignee', 'Consignee'), ('shipper', 'Shipper')):
+        m = re.search(label + r'[:\s]*(.{1,80}?)\s{2,}', text, re.IGNORECASE) or re.search(label + r'[:\s]*(\w[\w\s\,\-\.]{1,80})', text, re.IGNORECASE)
+        if m:
+            res[key] = m.group(1).strip()
+    return res
+
+
+SAMPLES = [
+    "COMMERCIAL INVOICE\nInvoice No: 4411\nHS: 85044010\nCurrency USD\nTotal value $ 12,500.00\nConsignee: ACME Trading LLC  \nShipper: Foo Industries Ltd  \nContainer MSCU1234567\nAWB 176-12345675",
+    "Packing list hs 850410 qty 1,000 pcs gross 1,234.5 kg EUR",
+    "Bill of lading  Shipper: Global Exports Co.   Consignee: Dubai Imports FZE   AWB: X12345 container TGHU7654321 value 99,999.99 GBP",
+    "no useful content here",
+    "",
+    "Delivery order 123456 for consignee: Someone\nPort of discharge Jebel Ali\n176 12345675 AED 5,000",
+    "x" * 5000 + " HS 3004 " + "y " * 10000 + " INR 1,000,000 Consignee: Late Corp   ",
+    "HS:12345678901 awb-abc-123 CHF 12.5 value: €1.234,56",
+    "Consignee:\nMulti Line\nShipper:   Spaced   Name  ",
+    "123456 AWB USD",
+    "AWB ABCD1234567 total 1,500",
+]
+
+
+class ParseTextForMetadataTests(SimpleTestCase):
+    # value and bol_awb_number intentionally differ from the reference: matches no longer
+    # overlap, so digits inside an HS/AWB match aren't reused as the value, and AWB numbers
+    # are captured whole ('AWB 176-12345675')
+    SHIFTED_KEYS = ('value', 'bol_awb_number')
+
+    def test_matches_reference_parser(self):
+        for text in SAMPLES:
+            with self.subTest(text=text[:40]):
+                expected = {k: v for k, v in reference_parse(text).items() if k not in self.SHIFTED_KEYS}
+                parsed = {k: v for k, v in parse_text_for_metadata(text).items() if k not in self.SHIFTED_KEYS}
+                self.assertEqual(parsed, expected)
+
+    def test_value_and_awb(self):
+        self.assertEqual(parse_text_for_metadata(SAMPLES[0])['bol_awb_number'], 'AWB 176-12345675')
+        self.assertEqual(parse_text_for_metadata(SAMPLES[0])['value'], '4411')
+        self.assertEqual(parse_text_for_metadata(SAMPLES[1])['value'], '1000')
+        self.assertEqual(parse_text_for_metadata(SAMPLES[5])['bol_awb_number'], '176 12345675')
+
+    def test_awb_does_not_hide_currency_or_container(self):
+        parsed = parse_text_for_metadata("123456 AWB USD")
+        self.assertEqual(parsed['currency'], 'USD')
+        parsed = parse_text_for_metadata("AWB ABCD1234567 total 1,500")
+        self.assertEqual(parsed['container_number'], 'ABCD1234567')
+        self.assertEqual(parsed['value'], '1500')
+
+    def test_trailing_party_label_is_not_a_match(self):
+        self.assertEqual(parse_text_for_metadata("Invoice ACME\nConsignee:"), {})
+        self.assertEqual(parse_text_for_metadata("Shipper: "), {})
+        self.assertEqual(parse_text_for_metadata("Consignee: ACME LLC")['consignee'], 'ACME LLC')
+
+
+@mock.patch('documents.tasks._queue_audit_log')
+class RunValidationForDocumentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='uploader', password='pw')
+
+    def make_doc(self, doc_type, **metadata):
+        return TradeDocument.objects.create(doc_type=doc_type, uploader=self.user, metadata=metadata)
+
+    def test_numeric_and_padded_values_match(self, _audit):
+        doc = self.make_doc(TradeDocument.TYPE_INVOICE, hs_code='850410', value=1500)
+        packing = self.make_doc(TradeDocument.TYPE_PACKING, hs_code=' 850410 ', value='1500')
+        results = run_validation_for_document(doc.id)
+        self.assertEqual(results['match_keys'], {'hs_code': '850410', 'value': '1500'})
+        self.assertEqual(results['found_types'][TradeDocument.TYPE_PACKING], {'doc_id': packing.id, 'matched': True})
+
+    def test_candidate_missing_a_key_is_excluded(self, _audit):
+        doc = self.make_doc(TradeDocument.TYPE_INVOICE, hs_code='850410', currency='USD')
+        self.make_doc(TradeDocument.TYPE_PACKING, hs_code='850410')
+        results = run_validation_for_document(doc.id)
+        self.assertIn(TradeDocument.TYPE_PACKING, results['missing_types'])
+        self.assertNotIn(TradeDocument.TYPE_PACKING, results['found_types'])
+
+    def test_lowest_pk_wins_per_type(self, _audit):
+        doc = self.make_doc(TradeDocument.TYPE_INVOICE, hs_code='850410')
+        first = self.make_doc(TradeDocument.TYPE_BOL, hs_code='850410')
+        self.make_doc(TradeDocument.TYPE_BOL, hs_code='850410')
+        results = run_validation_for_document(doc.id)
+        self.assertEqual(results['found_types'][TradeDocument.TYPE_BOL]['doc_id'], first.id)
+
+    def test_document_without_metadata_gets_reason(self, _audit):
+        doc = self.make_doc(TradeDocument.TYPE_INVOICE)
+        results = run_validation_for_document(doc.id)
+        self.assertEqual(results['reason'], 'metadata_missing')
+        self.assertFalse(results['ready_for_approval'])
+        doc.refresh_from_db()
+        self.assertEqual(doc.last_validation, results)
+        self.assertEqual(doc.validation_results.count(), 1)
+
+
+class DocumentFileTextTests(SimpleTestCase):
+    def test_extracted_text_round_trip(self):
+        df = DocumentFile()
+        self.assertIsNone(df.extracted_text)
+        self.assertEqual(df.get_text_snippet(), '')
+        df.extracted_text = 'Grüße\nHS 850410'
+        self.assertEqual(df.extracted_text, 'Grüße\nHS 850410')
+        self.assertEqual(df.get_text_snippet(), 'Grüße HS 850410')
+
+    def test_snippet_inflates_only_the_head(self):
+        df = DocumentFile()
+        df.extracted_text = 'é' * 10 + 'x' * 100000
+        self.assertEqual(df.get_text_snippet(20), 'é' * 10 + 'x' * 10 + '...')
+        df.extracted_text = 'a' * 20
+        self.assertEqual(df.get_text_snippet(20), 'a' * 20)
+
+
+class CompressExtractedTextMigrationTests(TransactionTestCase):
+    before = [('documents', '0006_tradedocument_status_reviewer_index')]
+    after = [('documents', '0007_compress_documentfile_extracted_text')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_round_trip(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model('users', 'User').objects.create(username='uploader')
+        doc = apps.get_model('documents', 'TradeDocument').objects.create(doc_type='invoice', uploader_id=user.id)
+        files = apps.get_model('documents', 'DocumentFile').objects
+        text = 'HS 850410 ' * 500
+        with_text = files.create(document_id=doc.id, field_name='hs_code', file='a.pdf', extracted_text=text)
+        without_text = files.create(document_id=doc.id, field_name='value', file='b.pdf')
+
+        apps = self.migrate(self.after)
+        files = apps.get_model('documents', 'DocumentFile').objects
+        compressed = files.get(pk=with_text.pk).extracted_text_compressed
+        self.assertEqual(zlib.decompress(compressed).decode('utf-8'), text)
+        self.assertLess(len(compressed), len(text))
+        self.assertIsNone(files.get(pk=without_text.pk).extracted_text_compressed)
+
+        apps = self.migrate(self.before)
+        files = apps.get_model('documents', 'DocumentFile').objects
+        self.assertEqual(files.get(pk=with_text.pk).extracted_text, text)
+        self.assertIsNone(files.get(pk=without_text.pk).extracted_text)
+
+
+class AuditLogMiddlewareTests(TransactionTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='uploader', password='pw')
+
+    def request(self, view):
+        request = RequestFactory().post('/')
+        request.user = self.user
+        return AuditLogMiddleware(view)(request)
+
+    def test_entries_are_flushed_in_one_insert(self):
+        def view(request):
+            record_audit(request, 'first')
+            record_audit(request, 'second', {'doc_id': 1})
+            self.assertFalse(AuditLog.objects.exists())
+            return HttpResponse()
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.request(view)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(list(AuditLog.objects.order_by('pk').values_list('action', 'details')), [('first', None), ('second', {'doc_id': 1})])
+
+    def test_entry_recorded_in_a_transaction_rolls_back_with_it(self):
+        def view(request):
+            try:
+                with transaction.atomic():
+                    record_audit(request, 'rolled_back')
+                    self.assertTrue(AuditLog.objects.exists())
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            return HttpResponse()
+
+        self.request(view)
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_flush_failure_is_logged_not_raised(self):
+        def view(request):
+            record_audit(request, 'lost')
+            return HttpResponse(status=201)
+
+        with mock.patch.object(AuditLog.objects, 'bulk_create', side_effect=RuntimeError('db down')), \
+                self.assertLogs('documents.middleware', 'ERROR'):
+            response = self.request(view)
+        self.assertEqual(response.status_code, 201)
+
+
+def form_data(**fields):
+    # the upload view validates request.POST, where metadata arrives as a JSON string
+    data = QueryDict(mutable=True)
+    data.update(fields)
+    return data
+
+
+class UploadDocumentSerializerTests(SimpleTestCase):
+    def validated(self, **fields):
+        serializer = UploadDocumentSerializer(data=form_data(**fields))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.validated_data
+
+    def test_form_fields_fill_missing_metadata(self):
+        data = self.validated(doc_type='delivery_order', metadata='{"currency": "EUR"}', currency='USD', value=' 100 ', hs_code=' 850410 ')
+        self.assertEqual(data['metadata'], {'currency': 'EUR', 'value': '100', 'hs_code': '850410'})
+        self.assertEqual(data['hs_code'], '850410')
+
+    def test_currency_and_value_only_apply_to_delivery_orders(self):
+        data = self.validated(doc_type='invoice', currency='USD', value='100', hs_code='850410')
+        self.assertEqual(data['metadata'], {'hs_code': '850410'})
+
+    def test_hs_code_is_read_from_metadata(self):
+        data = self.validated(doc_type='invoice', metadata='{"hs_code": " 3004 "}')
+        self.assertEqual(data['hs_code'], '3004')
+        self.assertIsNone(self.validated(doc_type='invoice')['hs_code'])
+
+    def test_rejects_non_object_metadata_and_long_hs_code(self):
+        serializer = UploadDocumentSerializer(data=form_data(doc_type='invoice', metadata='[1, 2]'))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('metadata', serializer.errors)
+        serializer = UploadDocumentSerializer(data=form_data(doc_type='invoice', hs_code='1' * 33))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('hs_code', serializer.errors)
+
+
+class DocumentUploadViewTests(TestCase):
+    def test_non_object_metadata_is_a_400(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username='uploader', password='pw'))
+        for metadata in ('[1, 2]', '"text"', '42'):
+            with self.subTest(metadata=metadata):
+                response = client.post(reverse('documents-upload'), {'doc_type': 'invoice', 'metadata': metadata})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('metadata', response.json())
+        self.assertFalse(TradeDocument.objects.exists())
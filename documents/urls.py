@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import DocumentUploadView, DocumentListView, DocumentDetailView, ApproveRejectView, RunValidationView, CommentCreateView, CommentListView, CurrencyConvertView, DocumentStatsView, UserPreferenceView, ToggleDarkModeView,
-TriggerExtractionView,RunValidationView
+from .views import (
+    DocumentUploadView, DocumentListView, DocumentDetailView, ApproveRejectView, RunValidationView, CommentCreateView, CommentListView,
+    CurrencyConvertView, TriggerExtractionView, document_stats, user_preferences, toggle_dark_mode,
+)
 urlpatterns = [
     path('upload/', DocumentUploadView.as_view(), name='documents-upload'),
     path('', DocumentListView.as_view(), name='documents-list'),
@@ -10,9 +12,8 @@ urlpatterns = [
     path('<int:pk>/comments/', CommentListView.as_view(), name='documents-comments'),
     path('comments/create/', CommentCreateView.as_view(), name='comments-create'),
     path('currency-convert/', CurrencyConvertView.as_view(), name='currency-convert'),
-    path('document-stats/', DocumentStatsView.as_view(), name='document-stats'),
-    path('user/preferences/', UserPreferenceView.as_view(), name='user-preferences'),
-    path('user/preferences/toggle-dark-mode/', ToggleDarkModeView.as_view(), name='user-preferences-toggle-dark'),
-    path('<int:pk>/extract/', views.TriggerExtractionView.as_view(), name='documents-extract'),
-    path('<int:pk>/validate/', views.RunValidationView.as_view(), name='documents-validate'),
+    path('document-stats/', document_stats, name='document-stats'),
+    path('user/preferences/', user_preferences, name='user-preferences'),
+    path('user/preferences/toggle-dark-mode/', toggle_dark_mode, name='user-preferences-toggle-dark'),
+    path('<int:pk>/extract/', TriggerExtractionView.as_view(), name='documents-extract'),
 ]
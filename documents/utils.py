@@ -1,31 +1,83 @@
+import time
 import requests
 from decimal import Decimal
-from .models import CurrencyRate
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.core.cache import cache
+from django.forms.models import model_to_dict
+from .models import CurrencyRate, UserPreference
 
 EXCHANGE_API = "https://api.exchangerate.host/latest"
+RATE_CACHE_TIMEOUT = 3600
+
+# reused across calls so keep-alive connections to the FX API are pooled
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], allowed_methods=['GET']),
+))
+# process-local tier in front of the shared cache: currency -> (rate, expires_at)
+_local_rates = {}
+
+def _remember_rate(currency: str, rate: Decimal) -> Decimal:
+    _local_rates[currency] = (rate, time.monotonic() + RATE_CACHE_TIMEOUT)
+    cache.set(f'fx:{currency}', str(rate), RATE_CACHE_TIMEOUT)
+    return rate
 
 def get_rate_to_aed(currency: str) -> Decimal:
     currency = currency.upper()
+    local = _local_rates.get(currency)
+    if local and local[1] > time.monotonic():
+        return local[0]
+
+    cached = cache.get(f'fx:{currency}')
+    if cached is not None:
+        rate = Decimal(cached)
+        _local_rates[currency] = (rate, time.monotonic() + RATE_CACHE_TIMEOUT)
+        return rate
+
     try:
         cr = CurrencyRate.objects.get(currency=currency)
-        return Decimal(cr.rate_to_aed)
+        return _remember_rate(currency, Decimal(cr.rate_to_aed))
     except CurrencyRate.DoesNotExist:
         pass
 
     params = {'base': currency, 'symbols': 'AED'}
-    resp = requests.get(EXCHANGE_API, params=params, timeout=10)
+    resp = _SESSION.get(EXCHANGE_API, params=params, timeout=(3, 7))
     resp.raise_for_status()
     data = resp.json()
     if data.get('rates') and 'AED' in data['rates']:
         rate = Decimal(str(data['rates']['AED']))
         CurrencyRate.objects.update_or_create(currency=currency, defaults={'rate_to_aed': rate})
-        return rate
+        return _remember_rate(currency, rate)
     raise ValueError(f"Unable to fetch rate for {currency}")
 
+PREFERENCE_CACHE_TIMEOUT = 300
+PREFERENCE_FIELDS = ['dark_mode', 'email_notifications']
+
+def get_user_preference_data(user_id) -> dict:
+    """Read-through cache of a user's preferences, creating the row on first access."""
+    key = f'pref:{user_id}'
+    data = cache.get(key)
+    if data is None:
+        try:
+            pref = UserPreference.objects.only('id', *PREFERENCE_FIELDS).get(user_id=user_id)
+        except UserPreference.DoesNotExist:
+            pref, _ = UserPreference.objects.get_or_create(user_id=user_id)
+        data = model_to_dict(pref, fields=PREFERENCE_FIELDS)
+        cache.set(key, data, PREFERENCE_CACHE_TIMEOUT)
+    return data
+
+def invalidate_user_preference(user_id):
+    cache.delete(f'pref:{user_id}')
+
+# duty rate by 2-digit HS chapter; anything not listed pays the default rate
+_DUTY_TABLE = {'85': Decimal('0.05')}
+_DUTY_DEFAULT = Decimal('0.10')
+_CENT = Decimal('0.01')
+
 def calculate_duties_from_hs(hs_code: str, value_in_aed: Decimal):
-    if hs_code and str(hs_code).strip().startswith('85'):
-        pct = Decimal('0.05')
-    else:
-        pct = Decimal('0.10')
-    duties = (value_in_aed * pct).quantize(Decimal('0.01'))
-    return {'duty_percentage': pct, 'duties': duties}
\ No newline at end of file
+    prefix = str(hs_code or '').lstrip()[:2]
+    pct = _DUTY_TABLE.get(prefix, _DUTY_DEFAULT)
+    return {'duty_percentage': pct, 'duties': (value_in_aed * pct).quantize(_CENT)}
\ No newline at end of file
@@ -1,93 +1,110 @@
 import json
+import orjson
+from functools import wraps
 from rest_framework import generics, status, permissions, views
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
-from .models import TradeDocument, DocumentFile, ValidationRule, ValidationResult, Comment, CurrencyRate, AuditLog, UserPreference
+from .models import TradeDocument, DocumentFile, ValidationRule, ValidationResult, Comment, CurrencyRate, UserPreference, REQUIRED_FIELDS, REQUIRED_FIELD_SETS
 from .serializers import UploadDocumentSerializer, TradeDocumentListSerializer, TradeDocumentDetailSerializer, DocumentFileSerializer, CommentSerializer, ValidationRuleSerializer, ValidationResultSerializer, CurrencyRateSerializer, UserPreferenceSerializer
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import Count, Prefetch, Q
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
 from decimal import Decimal
-from .utils import get_rate_to_aed, calculate_duties_from_hs
+from .middleware import record_audit
+from .utils import get_rate_to_aed, get_user_preference_data, invalidate_user_preference
+from .tasks import compute_duties, extract_text_and_parse_task
 from rest_framework import views, permissions, status
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 
 User = get_user_model()
 
-# Fields required as file uploads per doc type
-REQUIRED_FIELDS = {
-    TradeDocument.TYPE_INVOICE: ['hs_code','goods_description','unit_of_measure','quantity','weight','value','currency'],
-    TradeDocument.TYPE_PACKING: ['hs_code','goods_description','unit_of_measure','quantity','gross_weight','net_weight','number_of_packages'],
-    TradeDocument.TYPE_BOL: ['shipper','consignee','hs_code','weight','number_of_packages','bol_awb_number'],
-    TradeDocument.TYPE_DELIVERY: ['consignee','container_number','port_of_discharge','currency','value','hs_code'],
-}
-
 class DocumentUploadView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     @transaction.atomic
     def post(self, request, *args, **kwargs):
-        # Validate doc_type and optional metadata JSON
-        serializer = UploadDocumentSerializer(data=request.data)
+        # Validate doc_type and optional metadata JSON (form-field fallbacks are folded in by the serializer).
+        # File parts reuse names like hs_code, so only plain form fields are passed; files come from request.FILES.
+        serializer = UploadDocumentSerializer(data=request.POST)
         serializer.is_valid(raise_exception=True)
         doc_type = serializer.validated_data['doc_type']
-        metadata = serializer.validated_data.get('metadata', {})
+        metadata = serializer.validated_data['metadata']
 
-        required = REQUIRED_FIELDS.get(doc_type, [])
-        missing_files = [f for f in required if f not in request.FILES]
-        if missing_files:
+        required = REQUIRED_FIELDS.get(doc_type, ())
+        missing = REQUIRED_FIELD_SETS.get(doc_type, frozenset()).difference(request.FILES)
+        if missing:
+            missing_files = [f for f in required if f in missing]
             return Response({'detail': f"Missing required files for {doc_type}: {missing_files}"}, status=400)
 
         # Create TradeDocument record
-        trade_doc = TradeDocument.objects.create(doc_type=doc_type, uploader=request.user, status=TradeDocument.STATUS_PENDING, metadata=metadata)
+        trade_doc = TradeDocument.objects.create(doc_type=doc_type, uploader=request.user, status=TradeDocument.STATUS_PENDING, metadata=metadata, hs_code=serializer.validated_data['hs_code'])
 
-        # Save each required file using DocumentFile model
+        # Store each required file, then insert all DocumentFile rows in one query.
+        # Each file is written to storage explicitly here; bulk_create's FileField.pre_save
+        # then finds it already committed and leaves it alone.
         created_files = []
         for field in required:
-            uploaded_file = request.FILES.get(field)
-            if not uploaded_file:
-                continue  # already handled missing case above
-            df = DocumentFile.objects.create(document=trade_doc, field_name=field, file=uploaded_file)
+            uploaded_file = request.FILES[field]  # presence checked above
+            df = DocumentFile(document=trade_doc, field_name=field)
+            df.file.save(uploaded_file.name, uploaded_file, save=False)
             created_files.append(df)
+        DocumentFile.objects.bulk_create(created_files)
+
+        # Currency conversion/duties and text extraction run in Celery once the upload is committed
+        doc_id = trade_doc.id
+        file_ids = [df.id for df in created_files]
+
+        def enqueue_post_upload_tasks():
+            if doc_type == TradeDocument.TYPE_DELIVERY:
+                compute_duties.delay(doc_id)
+            for file_id in file_ids:
+                extract_text_and_parse_task.delay(file_id)
 
-        # If delivery order, perform currency conversion/duties if metadata contains 'currency' and 'value'
-        if doc_type == TradeDocument.TYPE_DELIVERY:
-            currency = metadata.get('currency') or request.POST.get('currency')
-            value = metadata.get('value') or request.POST.get('value')
-            if currency and value:
-                try:
-                    rate = get_rate_to_aed(currency)
-                    raw_value = Decimal(str(value))
-                    value_in_aed = (raw_value * Decimal(str(rate))).quantize(Decimal('0.01'))
-                    duties_res = calculate_duties_from_hs(metadata.get('hs_code', '') or request.POST.get('hs_code', ''), value_in_aed)
-                    # store calculations inside metadata for quick access in UI
-                    trade_doc.metadata = {**trade_doc.metadata, 'value_in_aed': str(value_in_aed), 'duties': str(duties_res['duties']), 'duty_percentage': str(duties_res['duty_percentage'])}
-                    trade_doc.save(update_fields=['metadata'])
-                except Exception as e:
-                    # still allow upload but inform frontend
-                    AuditLog.objects.create(user=request.user, action='currency_conversion_failed', details={'doc_id': trade_doc.id, 'error': str(e)})
-                    return Response({'detail': f'Uploaded but currency/duties calculation failed: {str(e)}'}, status=201)
-
-        AuditLog.objects.create(user=request.user, action='uploaded_document', details={'doc_id': trade_doc.id, 'doc_type': doc_type, 'files': [f.field_name for f in created_files]})
+        transaction.on_commit(enqueue_post_upload_tasks)
+
+        record_audit(request, 'uploaded_document', {'doc_id': trade_doc.id, 'doc_type': doc_type, 'files': [f.field_name for f in created_files]})
         return Response({'detail': 'Uploaded', 'document_id': trade_doc.id}, status=201)
 
+class DocumentCursorPagination(CursorPagination):
+    # keyset pagination: each page is a `created_at < cursor` range scan, not an OFFSET
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
 class DocumentListView(generics.ListAPIView):
     serializer_class = TradeDocumentListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = DocumentCursorPagination
 
     def get_queryset(self):
         user = self.request.user
-        qs = TradeDocument.objects.all().order_by('-created_at')
+        qs = (
+            TradeDocument.objects
+            .select_related('uploader', 'assigned_reviewer')
+            .prefetch_related(Prefetch('files', queryset=DocumentFile.objects.only('id', 'document_id', 'field_name', 'file', 'uploaded_at')))
+            .order_by('-created_at')
+        )
         if user.is_admin():
             return qs
         if user.is_reviewer():
-            return (qs.filter(assigned_reviewer=user) | qs.filter(status=TradeDocument.STATUS_PENDING, assigned_reviewer__isnull=True)).distinct()
+            return qs.filter(Q(assigned_reviewer=user) | Q(status=TradeDocument.STATUS_PENDING, assigned_reviewer__isnull=True))
         return qs.filter(uploader=user)
 
 class DocumentDetailView(generics.RetrieveAPIView):
     serializer_class = TradeDocumentDetailSerializer
     permission_classes = [permissions.IsAuthenticated]
-    queryset = TradeDocument.objects.all()
+    queryset = (
+        TradeDocument.objects
+        .select_related('uploader', 'assigned_reviewer')
+        .prefetch_related('files')
+    )
 
 class ApproveRejectView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -109,10 +126,10 @@ class ApproveRejectView(views.APIView):
             doc.status = TradeDocument.STATUS_REJECTED
         else:
             return Response({'detail': 'Invalid action'}, status=400)
-        doc.save()
+        doc.save(update_fields=['status', 'updated_at'])
         if comment:
             Comment.objects.create(document=doc, user=request.user, text=comment)
-        AuditLog.objects.create(user=request.user, action=f'{action}_document', details={'doc_id': doc.id})
+        record_audit(request, f'{action}_document', {'doc_id': doc.id})
         return Response({'detail': f'Document {action}d'})
 
 class RunValidationView(views.APIView):
@@ -122,17 +139,14 @@ class RunValidationView(views.APIView):
         doc = get_object_or_404(TradeDocument, pk=pk)
         results = {}
         # 1) check file presence for required fields
-        required = REQUIRED_FIELDS.get(doc.doc_type, [])
-        existing_files = {f.field_name for f in doc.files.all()}
-        missing_files = [f for f in required if f not in existing_files]
-        results['missing_files'] = missing_files
+        missing = REQUIRED_FIELD_SETS.get(doc.doc_type, frozenset()).difference(doc.files.values_list('field_name', flat=True))
+        results['missing_files'] = [f for f in REQUIRED_FIELDS[doc.doc_type] if f in missing] if missing else []
 
         # 2) for delivery doc check metadata for value/currency to compute matching HS or other logic
         if doc.doc_type == TradeDocument.TYPE_DELIVERY:
-            hs = doc.metadata.get('hs_code') or None
+            hs = doc.hs_code
             if hs:
-                same_hs_docs = TradeDocument.objects.filter(uploader=doc.uploader, files__field_name='hs_code', files__file__icontains=hs).distinct()
-                results['matching_hs_count'] = same_hs_docs.count()
+                results['matching_hs_count'] = TradeDocument.objects.filter(uploader_id=doc.uploader_id, hs_code=hs).count()
             # also surface computed duties if present
             if doc.metadata.get('duties'):
                 results['duties'] = doc.metadata['duties']
@@ -141,7 +155,7 @@ class RunValidationView(views.APIView):
         ValidationResult.objects.create(document=doc, result=results, run_by=request.user)
         doc.last_validation = results
         doc.save(update_fields=['last_validation'])
-        AuditLog.objects.create(user=request.user, action='run_validation', details={'doc_id': doc.id, 'results': results})
+        record_audit(request, 'run_validation', {'doc_id': doc.id, 'results': results})
         return Response({'results': results})
 
 class CommentCreateView(generics.CreateAPIView):
@@ -150,7 +164,7 @@ class CommentCreateView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
-        AuditLog.objects.create(user=self.request.user, action='add_comment', details={'document': serializer.validated_data.get('document').id})
+        record_audit(self.request, 'add_comment', {'document': serializer.validated_data.get('document').id})
 
 class CommentListView(generics.ListAPIView):
     serializer_class = CommentSerializer
@@ -175,45 +189,95 @@ class CurrencyConvertView(views.APIView):
         except Exception as e:
             return Response({'detail': str(e)}, status=400)
 
-class DocumentStatsView(views.APIView):
-    permission_classes = [permissions.IsAuthenticated]
+def json_response(data, status=200, headers=None):
+    return HttpResponse(orjson.dumps(data), status=status, content_type='application/json', headers=headers)
 
-    def get(self, request):
-        user = request.user
-        qs = TradeDocument.objects.all()
-        if not user.is_admin():
-            if user.is_reviewer():
-                qs = (qs.filter(assigned_reviewer=user) | qs.filter(status=TradeDocument.STATUS_PENDING, assigned_reviewer__isnull=True)).distinct()
-            else:
-                qs = qs.filter(uploader=user)
-        total = qs.count()
-        by_status = {}
-        for status_choice, _ in TradeDocument.STATUS_CHOICES:
-            by_status[status_choice] = qs.filter(status=status_choice).count()
-        return Response({'total': total, 'by_status': by_status})
+def jwt_authenticated(view_func):
+    """
+    For small JSON endpoints served as plain Django views: authenticate the Bearer
+    token with simplejwt (same as DRF would) and expose the user as request.user,
+    skipping DRF's request wrapping, negotiation and renderer machinery.
+    """
+    authenticator = JWTAuthentication()
+
+    @csrf_exempt
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            auth = authenticator.authenticate(request)
+        except AuthenticationFailed as exc:
+            # same body DRF's exception handler would produce
+            auth, error = None, exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+        else:
+            error = {'detail': 'Authentication credentials were not provided.'}
+        if auth is None:
+            return json_response(error, status=401, headers={'WWW-Authenticate': authenticator.authenticate_header(request)})
+        request.user = auth[0]
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+def allow_methods(*methods):
+    """
+    require_http_methods with DRF's JSON 405 response. Apply it beneath
+    jwt_authenticated so, as with an APIView, unauthenticated requests get 401 first.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405, headers={'Allow': ', '.join(methods)})
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+@jwt_authenticated
+@allow_methods('GET')
+def document_stats(request):
+    user = request.user
+    qs = TradeDocument.objects.all()
+    if not user.is_admin():
+        if user.is_reviewer():
+            qs = qs.filter(Q(assigned_reviewer=user) | Q(status=TradeDocument.STATUS_PENDING, assigned_reviewer__isnull=True))
+        else:
+            qs = qs.filter(uploader=user)
+    by_status = {status_choice: 0 for status_choice, _ in TradeDocument.STATUS_CHOICES}
+    for row in qs.order_by().values('status').annotate(c=Count('id')):
+        by_status[row['status']] = row['c']
+    total = sum(by_status.values())
+    return json_response({'total': total, 'by_status': by_status})
 
 class UserPreferenceView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def get(self, request):
-        pref, _ = UserPreference.objects.get_or_create(user=request.user)
-        return Response(UserPreferenceSerializer(pref).data)
-
     def post(self, request):
         pref, _ = UserPreference.objects.get_or_create(user=request.user)
         serializer = UserPreferenceSerializer(pref, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        invalidate_user_preference(request.user.id)
         return Response(serializer.data)
 
-class ToggleDarkModeView(views.APIView):
-    permission_classes = [permissions.IsAuthenticated]
+_update_user_preferences = UserPreferenceView.as_view()
 
-    def post(self, request):
-        pref, _ = UserPreference.objects.get_or_create(user=request.user)
-        pref.dark_mode = not pref.dark_mode
-        pref.save()
-        return Response({'dark_mode': pref.dark_mode})
+@jwt_authenticated
+def _get_user_preferences(request):
+    return json_response(get_user_preference_data(request.user.id))
+
+@csrf_exempt
+def user_preferences(request):
+    # reads are served without DRF; updates still go through UserPreferenceView's serializer
+    if request.method == 'GET':
+        return _get_user_preferences(request)
+    return _update_user_preferences(request)
+
+@jwt_authenticated
+@allow_methods('POST')
+def toggle_dark_mode(request):
+    pref, _ = UserPreference.objects.get_or_create(user=request.user)
+    pref.dark_mode = not pref.dark_mode
+    pref.save(update_fields=['dark_mode'])
+    invalidate_user_preference(request.user.id)
+    return json_response({'dark_mode': pref.dark_mode})
 
 
 
@@ -227,16 +291,13 @@ class TriggerExtractionView(views.APIView):
             return Response({'detail': 'Not permitted'}, status=status.HTTP_403_FORBIDDEN)
 
         enqueued = []
-        for f in doc.files.all():
+        for f in doc.files.defer('extracted_text_compressed'):
             f.extraction_status = DocumentFile.STATUS_PENDING
             f.extracted_text = ''
-            f.save(update_fields=['extraction_status', 'extracted_text'])
+            f.save(update_fields=['extraction_status', 'extracted_text_compressed'])
             extract_text_and_parse_task.delay(f.id)
             enqueued.append(f.field_name)
 
-        try:
-            AuditLog.objects.create(user=request.user, action='trigger_extraction', details={'doc_id': doc.id, 'fields': enqueued})
-        except Exception:
-            pass
+        record_audit(request, 'trigger_extraction', {'doc_id': doc.id, 'fields': enqueued})
 
         return Response({'detail': 'Extraction enqueued', 'fields': enqueued}, status=status.HTTP_202_ACCEPTED)